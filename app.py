@@ -1,13 +1,21 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-from datetime import datetime, timedelta
+import redis
+import diskcache
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import heapq
+import time
 import hashlib
-import json
+import orjson
+import re
+import unicodedata
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,79 +23,231 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Initialize rate limiter with in-memory storage (for development)
+# Shared Redis for rate limits and the L2 summary cache; without it everything stays per-process
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Initialize rate limiter, falling back to in-memory storage (for development)
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    storage_uri=REDIS_URL or "memory://",
+    # Keep enforcing limits per process instead of failing requests while Redis is unreachable
+    in_memory_fallback_enabled=True
 )
+# Per-client budget of summaries shared by /summarize and /summarize/batch
+SUMMARIZE_LIMIT = "10 per minute"
 
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
     raise ValueError("Error env")
 
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.5-flash')
+# REST transport goes through sockets gevent workers patch; the default gRPC transport would block them
+genai.configure(api_key=GEMINI_API_KEY, transport='rest')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+# Short texts go to a smaller, faster model; the full model is kept for longer inputs
+GEMINI_SMALL_MODEL = os.getenv('GEMINI_SMALL_MODEL', 'gemini-2.5-flash-lite')
+SMALL_TEXT_CHARS = int(os.getenv('SMALL_TEXT_CHARS', '2000'))
+# Upper bound on a single Gemini call so a stalled request can't hold a worker thread indefinitely
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '30'))
 
-# In-memory cache with expiration
+# In-memory LFU cache with expiration, bounded to CACHE_MAX_ENTRIES summaries.
+# Entries are (summary, expiry, freq) tuples with expiry on the time.monotonic() clock.
+# Keys are grouped into buckets by hit count, each bucket ordered oldest-first,
+# so one-off texts are evicted before summaries that keep getting requested.
 cache = {}
-CACHE_EXPIRATION = timedelta(hours=1)
+freq_buckets = {}
+min_freq = 0
+cache_lock = threading.Lock()
+CACHE_EXPIRATION = 60.0 * 60  # seconds
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+
+# L2 cache shared by all workers, consulted on a local cache miss: Redis when configured,
+# otherwise an on-disk SQLite cache that also survives restarts and redeploys
+redis_client = None
+disk_cache = None
+if REDIS_URL:
+    redis_client = redis.Redis(
+        connection_pool=redis.BlockingConnectionPool.from_url(REDIS_URL, max_connections=32)
+    )
+else:
+    disk_cache = diskcache.Cache(
+        os.getenv('CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')),
+        size_limit=int(os.getenv('CACHE_SIZE_LIMIT', str(1 << 30))),
+        eviction_policy='least-recently-used'
+    )
+REDIS_KEY_PREFIX = b'summary:'
+
+# Min-heap of (expiry, cache_key) so expired entries can be purged without scanning the cache
+expiration_heap = []
+
+# Futures for summaries currently being generated, so concurrent identical requests share one call
+in_flight = {}
+in_flight_lock = threading.Lock()
+
+# Longest text accepted for summarization; larger inputs are rejected before hashing or calling Gemini
+MAX_TEXT_CHARS = int(os.getenv('MAX_TEXT_CHARS', '200000'))
+
+# Each item is charged against SUMMARIZE_LIMIT, so a batch can't be larger than that budget
+BATCH_MAX_ITEMS = 10
+# Worker pool that fans out the cache misses of a /summarize/batch request to Gemini
+batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_WORKERS', '8')))
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_for_cache(text):
+    """Normalize text so whitespace, casing and Unicode form differences share a cache entry"""
+    return WHITESPACE_RE.sub(' ', unicodedata.normalize('NFKC', text)).strip().lower()
 
 def get_cache_key(text, summary_type):
-    """Generate a unique cache key for the text and summary type"""
-    return hashlib.md5(f"{text}_{summary_type}".encode()).hexdigest()
-
-def get_cached_summary(text, summary_type):
-    """Get summary from cache if it exists and hasn't expired"""
-    cache_key = get_cache_key(text, summary_type)
-    if cache_key in cache:
-        cached_data = cache[cache_key]
-        if datetime.now() - cached_data['timestamp'] < CACHE_EXPIRATION:
-            return cached_data['summary']
+    """Generate a unique cache key for the text and summary type as a raw 16-byte digest"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(normalize_for_cache(text).encode('utf-8'))
+    h.update(b'\x00')
+    h.update(summary_type.encode('utf-8'))
+    return h.digest()
+
+def _remove_entry(cache_key):
+    """Drop an entry and its frequency bucket slot (caller holds cache_lock)"""
+    freq = cache.pop(cache_key)[2]
+    bucket = freq_buckets[freq]
+    del bucket[cache_key]
+    if not bucket:
+        del freq_buckets[freq]
+
+def _touch_entry(cache_key, summary, expiry):
+    """Store the entry and move it up to the next frequency bucket (caller holds cache_lock)"""
+    global min_freq
+    freq = cache[cache_key][2]
+    bucket = freq_buckets[freq]
+    del bucket[cache_key]
+    if not bucket:
+        del freq_buckets[freq]
+        if min_freq == freq:
+            min_freq = freq + 1
+    cache[cache_key] = (summary, expiry, freq + 1)
+    freq_buckets.setdefault(freq + 1, OrderedDict())[cache_key] = None
+
+def _evict_entry():
+    """Evict the oldest entry among the least frequently used (caller holds cache_lock)"""
+    global min_freq
+    if min_freq not in freq_buckets:
+        # Removals by expiry can empty the minimum bucket without updating min_freq
+        min_freq = min(freq_buckets)
+    cache_key, _ = freq_buckets[min_freq].popitem(last=False)
+    if not freq_buckets[min_freq]:
+        del freq_buckets[min_freq]
+    del cache[cache_key]
+
+def _get_local_summary(cache_key):
+    """Get summary from the local cache if it exists and hasn't expired"""
+    with cache_lock:
+        cached_data = cache.get(cache_key)
+        if cached_data is None:
+            return None
+        summary, expiry, _ = cached_data
+        if time.monotonic() < expiry:
+            _touch_entry(cache_key, summary, expiry)
+            return summary
+        _remove_entry(cache_key)
     return None
 
-def cache_summary(text, summary_type, summary):
-    """Cache the summary with timestamp"""
-    cache_key = get_cache_key(text, summary_type)
-    cache[cache_key] = {
-        'summary': summary,
-        'timestamp': datetime.now()
-    }
+def _cache_local_summary(cache_key, summary, ttl=CACHE_EXPIRATION):
+    """Cache the summary locally for ttl seconds, evicting the least frequently used entries"""
+    global min_freq
+    expiry = time.monotonic() + ttl
+    with cache_lock:
+        if cache_key in cache:
+            _touch_entry(cache_key, summary, expiry)
+        else:
+            while cache and len(cache) >= CACHE_MAX_ENTRIES:
+                _evict_entry()
+            cache[cache_key] = (summary, expiry, 1)
+            freq_buckets.setdefault(1, OrderedDict())[cache_key] = None
+            min_freq = 1
+        heapq.heappush(expiration_heap, (expiry, cache_key))
+        # Entries evicted or overwritten leave stale heap items behind; rebuild when they pile up
+        if len(expiration_heap) > 2 * CACHE_MAX_ENTRIES:
+            expiration_heap[:] = [(entry[1], key) for key, entry in cache.items()]
+            heapq.heapify(expiration_heap)
 
-def generate_summary(text, prompt):
-    """Generate summary"""
+def _get_shared_summary(cache_key):
+    """Get (summary, seconds left) from the L2 cache, or (None, 0) on a miss or unavailable backend"""
+    if redis_client is not None:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.get(REDIS_KEY_PREFIX + cache_key)
+            pipe.pttl(REDIS_KEY_PREFIX + cache_key)
+            cached_bytes, ttl_ms = pipe.execute()
+        except redis.RedisError:
+            app.logger.warning("Redis unavailable, skipping shared cache lookup")
+            return None, 0
+        if cached_bytes is None or ttl_ms == -2:
+            return None, 0
+        ttl = ttl_ms / 1000.0 if ttl_ms >= 0 else CACHE_EXPIRATION
+        return cached_bytes.decode('utf-8'), ttl
     try:
-        response = model.generate_content(prompt + "\n\nText to summarize:\n" + text)
-        return response.text
-    except Exception as e:
-        print(e)
-        if "429" in str(e):
-            raise Exception("Error generating summary")
-        elif "400" in str(e):
-            raise Exception("Invalid request. Please check your input text.")
-        elif "401" in str(e):
-            raise Exception("Error generating summary")
-        else:
-            raise Exception(f"Error generating summary")
+        summary, expire_time = disk_cache.get(cache_key, expire_time=True)
+    except diskcache.Timeout:
+        app.logger.warning("Disk cache busy, skipping shared cache lookup")
+        return None, 0
+    if summary is None:
+        return None, 0
+    # diskcache expiry is a wall-clock timestamp; convert it to the time left
+    ttl = expire_time - time.time() if expire_time is not None else CACHE_EXPIRATION
+    return summary, ttl
+
+def _cache_shared_summary(cache_key, summary):
+    """Store summary in the L2 cache with the same expiration as the local cache"""
+    if redis_client is not None:
+        try:
+            redis_client.setex(REDIS_KEY_PREFIX + cache_key, int(CACHE_EXPIRATION), summary.encode('utf-8'))
+        except redis.RedisError:
+            app.logger.warning("Redis unavailable, summary cached locally only")
+        return
+    try:
+        disk_cache.set(cache_key, summary, expire=CACHE_EXPIRATION)
+    except diskcache.Timeout:
+        app.logger.warning("Disk cache busy, summary cached locally only")
+
+def get_cached_summary(cache_key):
+    """Get summary from the local cache, then from the shared L2 cache"""
+    summary = _get_local_summary(cache_key)
+    if summary is not None:
+        return summary
+    summary, ttl = _get_shared_summary(cache_key)
+    if summary is None or ttl <= 0:
+        return None
+    # Keep the L2 entry's remaining lifetime so the summary can't outlive it locally
+    _cache_local_summary(cache_key, summary, min(ttl, CACHE_EXPIRATION))
+    return summary
+
+def cache_summary(cache_key, summary):
+    """Cache the summary locally and in the shared L2 cache"""
+    _cache_local_summary(cache_key, summary)
+    _cache_shared_summary(cache_key, summary)
 
-def generate_paragraph_summary(text):
-    prompt = """Summarize the following large text into a well-structured paragraph. 
+def sweep_expired(now):
+    """Remove expired entries from the cache, touching only the expired heap items"""
+    with cache_lock:
+        while expiration_heap and expiration_heap[0][0] <= now:
+            expiry, cache_key = heapq.heappop(expiration_heap)
+            cached_data = cache.get(cache_key)
+            if cached_data is not None and cached_data[1] == expiry:
+                _remove_entry(cache_key)
+
+# Prompt per summary type, built once at import and shared by every request
+PROMPTS = {
+    'paragraph': """Summarize the following large text into a well-structured paragraph. 
     Focus on the main points and key information. 
     Make it concise but comprehensive. 
-    Use clear and professional language."""
-    return generate_summary(text, prompt)
-
-def generate_two_paragraph_summary(text):
-    prompt = """Summarize the following large text into two well-structured paragraphs.
+    Use clear and professional language.""",
+    'two_paragraph': """Summarize the following large text into two well-structured paragraphs.
     First paragraph should focus on the main points and key information.
     Second paragraph should cover supporting details and additional context.
-    Use clear and professional language."""
-    return generate_summary(text, prompt)
-
-def generate_paragraph_bullet_summary(text):
-    prompt = """Summarize the following large text into a small well-structured paragraph and 3 bullet points.
+    Use clear and professional language.""",
+    'paragraph_bullet': """Summarize the following large text into a small well-structured paragraph and 3 bullet points.
     The paragraph should cover the main points and key information.
     The bullet points should highlight specific details or important aspects.
     Use clear and professional language.
@@ -96,35 +256,180 @@ def generate_paragraph_bullet_summary(text):
 
     • [First bullet point]
     • [Second bullet point]
-    • [Third bullet point]"""
-    return generate_summary(text, prompt)
-
-def generate_bullet_summary(text):
-    prompt = """Summarize the following large text into a maximum of 15 bullet points.
+    • [Third bullet point]""",
+    'bullet': """Summarize the following large text into a maximum of 15 bullet points.
     Focus on the most important information and key details.
     Each bullet point should be concise but informative.
     Use clear and professional language.
     The number of bullet points should be according to the length of the text and should cover all the important information.
     Format each point with a bullet point (•) symbol."""
-    return generate_summary(text, prompt)
+}
+
+# One model per summary type with its prompt as the system instruction, so the prompt is
+# configured once instead of being prepended to every request. Created at import so every
+# request reuses the SDK's cached client and its open connection.
+def _build_models(model_name):
+    return {
+        summary_type: genai.GenerativeModel(model_name, system_instruction=prompt)
+        for summary_type, prompt in PROMPTS.items()
+    }
+
+MODELS = _build_models(GEMINI_MODEL)
+SMALL_MODELS = _build_models(GEMINI_SMALL_MODEL)
+
+def select_model(text, summary_type):
+    """Pick the model for a summary type, routing short texts to the smaller model"""
+    models = SMALL_MODELS if len(text) < SMALL_TEXT_CHARS else MODELS
+    return models[summary_type]
+
+def generate_summary(text, summary_type):
+    """Generate summary of the requested type"""
+    try:
+        response = select_model(text, summary_type).generate_content(
+            text,
+            request_options={'timeout': GEMINI_TIMEOUT}
+        )
+        return response.text
+    except Exception as e:
+        print(e)
+        if "429" in str(e):
+            raise Exception("Error generating summary")
+        elif "400" in str(e):
+            raise Exception("Invalid request. Please check your input text.")
+        elif "401" in str(e):
+            raise Exception("Error generating summary")
+        else:
+            raise Exception(f"Error generating summary")
+
+def summarize_once(cache_key, text, summary_type):
+    """Generate and cache a summary, coalescing concurrent requests for the same cache key"""
+    with in_flight_lock:
+        future = in_flight.get(cache_key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            in_flight[cache_key] = future
+    if not is_leader:
+        return future.result()
+
+    try:
+        # A previous leader may have cached the summary between our cache miss and taking the lead
+        summary = get_cached_summary(cache_key)
+        if summary is None:
+            summary = generate_summary(text, summary_type)
+            cache_summary(cache_key, summary)
+        future.set_result(summary)
+        return summary
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with in_flight_lock:
+            del in_flight[cache_key]
+
+def _sse_event(payload):
+    """Format a payload as a server-sent event"""
+    return b''.join((b'data: ', orjson.dumps(payload), b'\n\n'))
+
+def _parse_json_body():
+    """Parse the request body as a JSON object with orjson, or return None if it isn't one"""
+    if 'json_body' not in g:
+        try:
+            data = orjson.loads(request.get_data(cache=False))
+        except orjson.JSONDecodeError:
+            data = None
+        # Memoized because the rate limiter's cost function reads the body before the view does
+        g.json_body = data if isinstance(data, dict) else None
+    return g.json_body
+
+def _batch_cost():
+    """Rate limit cost of a batch request: one per item, or one if the view will reject it"""
+    data = _parse_json_body()
+    items = data.get('items') if data is not None else None
+    if not isinstance(items, list) or not items or len(items) > BATCH_MAX_ITEMS:
+        return 1
+    return len(items)
+
+def stream_summary(cache_key, text, summary_type):
+    """Yield server-sent events carrying summary text as Gemini generates it"""
+    with in_flight_lock:
+        future = in_flight.get(cache_key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            in_flight[cache_key] = future
+
+    if not is_leader:
+        # Another request is already generating this summary; wait for it instead of paying twice
+        try:
+            summary = future.result()
+        except Exception:
+            app.logger.exception("Error in stream_summary")
+            yield _sse_event({'error': 'Error generating summary'})
+            return
+        yield _sse_event({'delta': summary})
+        yield _sse_event({'done': True, 'type': summary_type, 'cached': False})
+        return
+
+    try:
+        # A previous leader may have cached the summary between our cache miss and taking the lead
+        summary = get_cached_summary(cache_key)
+        if summary is not None:
+            yield _sse_event({'delta': summary})
+        else:
+            parts = []
+            response = select_model(text, summary_type).generate_content(
+                text,
+                stream=True,
+                request_options={'timeout': GEMINI_TIMEOUT}
+            )
+            for chunk in response:
+                parts.append(chunk.text)
+                yield _sse_event({'delta': chunk.text})
+            # Cache only once the full summary has streamed successfully
+            summary = ''.join(parts)
+            cache_summary(cache_key, summary)
+        future.set_result(summary)
+    except Exception as e:
+        future.set_exception(e)
+        app.logger.exception("Error in stream_summary")
+        yield _sse_event({'error': 'Error generating summary'})
+        return
+    finally:
+        if not future.done():
+            # The client disconnected mid-stream; release anyone waiting on this summary
+            future.set_exception(Exception("Error generating summary"))
+        with in_flight_lock:
+            del in_flight[cache_key]
+    yield _sse_event({'done': True, 'type': summary_type, 'cached': False})
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/summarize', methods=['POST'])
-@limiter.limit("10 per minute")
+@limiter.shared_limit(SUMMARIZE_LIMIT, scope='summarize')
 def summarize_text():
+    sweep_expired(time.monotonic())
     try:
-        data = request.get_json()
+        data = _parse_json_body()
+        if data is None:
+            return jsonify({'error': 'Invalid request. Please check your input text.'}), 400
         text = data.get('text', '')
         summary_type = data.get('type', 'paragraph')
+        stream = data.get('stream') is True
         
-        if not text:
+        if not text or not isinstance(text, str):
             return jsonify({'error': 'No text provided'}), 400
+        if len(text) > MAX_TEXT_CHARS:
+            return jsonify({'error': 'Text too long', 'max': MAX_TEXT_CHARS}), 413
+            
+        if not isinstance(summary_type, str) or summary_type not in PROMPTS:
+            return jsonify({'error': 'Invalid summary type'}), 400
             
         # Check cache first
-        cached_summary = get_cached_summary(text, summary_type)
+        cache_key = get_cache_key(text, summary_type)
+        cached_summary = get_cached_summary(cache_key)
         if cached_summary:
             return jsonify({
                 'summary': cached_summary,
@@ -133,19 +438,12 @@ def summarize_text():
             })
             
         # Generate summary based on type
-        if summary_type == 'paragraph':
-            summary = generate_paragraph_summary(text)
-        elif summary_type == 'two_paragraph':
-            summary = generate_two_paragraph_summary(text)
-        elif summary_type == 'paragraph_bullet':
-            summary = generate_paragraph_bullet_summary(text)
-        elif summary_type == 'bullet':
-            summary = generate_bullet_summary(text)
-        else:
-            return jsonify({'error': 'Invalid summary type'}), 400
-            
-        # Cache the result
-        cache_summary(text, summary_type, summary)
+        if stream:
+            return Response(
+                stream_with_context(stream_summary(cache_key, text, summary_type)),
+                mimetype='text/event-stream'
+            )
+        summary = summarize_once(cache_key, text, summary_type)
             
         return jsonify({
             'summary': summary,
@@ -165,5 +463,49 @@ def summarize_text():
         else:
             return jsonify({'error': 'Error generating summary'}), 500
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True) 
\ No newline at end of file
+def _summarize_batch_item(cache_key, text, summary_type):
+    """Summarize one batch item, reporting failures in the result instead of raising"""
+    try:
+        summary = summarize_once(cache_key, text, summary_type)
+    except Exception as e:
+        if "invalid request" in str(e).lower():
+            return {'error': 'Invalid request. Please check your input text.'}
+        return {'error': 'Error generating summary'}
+    return {'summary': summary, 'type': summary_type, 'cached': False}
+
+@app.route('/summarize/batch', methods=['POST'])
+@limiter.shared_limit(SUMMARIZE_LIMIT, scope='summarize', cost=_batch_cost)
+def summarize_batch():
+    sweep_expired(time.monotonic())
+    data = _parse_json_body()
+    items = data.get('items') if data is not None else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'No items provided'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Too many items, maximum is {BATCH_MAX_ITEMS}'}), 400
+
+    results = [None] * len(items)
+    pending = {}
+    for i, item in enumerate(items):
+        text = item.get('text', '') if isinstance(item, dict) else ''
+        summary_type = item.get('type', 'paragraph') if isinstance(item, dict) else None
+        if not text or not isinstance(text, str):
+            results[i] = {'error': 'No text provided'}
+            continue
+        if len(text) > MAX_TEXT_CHARS:
+            results[i] = {'error': 'Text too long', 'max': MAX_TEXT_CHARS}
+            continue
+        if not isinstance(summary_type, str) or summary_type not in PROMPTS:
+            results[i] = {'error': 'Invalid summary type'}
+            continue
+        cache_key = get_cache_key(text, summary_type)
+        cached_summary = get_cached_summary(cache_key)
+        if cached_summary:
+            results[i] = {'summary': cached_summary, 'type': summary_type, 'cached': True}
+            continue
+        pending[i] = batch_executor.submit(_summarize_batch_item, cache_key, text, summary_type)
+
+    for i, future in pending.items():
+        results[i] = future.result()
+
+    return jsonify({'results': results}) 
\ No newline at end of file
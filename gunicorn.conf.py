@@ -0,0 +1,14 @@
+import os
+
+# Gunicorn configuration: gevent workers so each process can hold many requests
+# waiting on Gemini at once
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+worker_class = 'gevent'
+worker_connections = 1000
+keepalive = 30
+timeout = 60
+# Heartbeat files on tmpfs so a slow disk can't make workers look hung (Linux only;
+# elsewhere gunicorn keeps its default temp directory)
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'